@@ -0,0 +1,91 @@
+"""Fire-and-forget telemetry.
+
+Readings are put on a bounded in-memory queue and a background thread
+flushes them to D1 in batches, so callers never block on the network.
+When the queue is full the oldest reading, and any batch the backend
+rejects, is moved to a capped dead-letter list instead. After every
+successful flush one batch of dead letters is re-sent; once the list is
+full the oldest entries are discarded.
+"""
+import queue
+import threading
+import time
+
+from .worker_client import send_batch_readings
+
+MAX_QUEUED = 50
+BATCH_SIZE = 10
+FLUSH_INTERVAL_SECONDS = 5
+MAX_DEAD_LETTERS = 100
+
+_QUEUE = queue.Queue(maxsize=MAX_QUEUED)
+_DLQ = []
+_dlq_lock = threading.Lock()
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def enqueue(reading):
+    """Queue one reading dict for upload, dropping the oldest if the queue is full."""
+    _ensure_flusher()
+    while True:
+        try:
+            _QUEUE.put_nowait(reading)
+            return
+        except queue.Full:
+            try:
+                dropped = _QUEUE.get_nowait()
+            except queue.Empty:
+                continue
+            _dead_letter([dropped])
+
+
+def _ensure_flusher():
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_forever, daemon=True)
+            _flusher.start()
+
+
+def _flush_forever():
+    """Send up to BATCH_SIZE readings at a time, or whatever arrived within FLUSH_INTERVAL_SECONDS."""
+    while True:
+        batch = [_QUEUE.get()]
+        deadline = time.monotonic() + FLUSH_INTERVAL_SECONDS
+        while len(batch) < BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_QUEUE.get(timeout=remaining))
+            except queue.Empty:
+                break
+        ok, _ = send_batch_readings(batch)
+        if ok:
+            _retry_dead_letters()
+        else:
+            _dead_letter(batch)
+
+
+def _dead_letter(readings, retry=False):
+    """Park readings for a later retry, keeping only the newest MAX_DEAD_LETTERS."""
+    with _dlq_lock:
+        if retry:
+            # Failed again, keep them ahead of anything parked since
+            _DLQ[:0] = readings
+        else:
+            _DLQ.extend(readings)
+        del _DLQ[:-MAX_DEAD_LETTERS]
+
+
+def _retry_dead_letters():
+    """Re-send one batch of dead letters now that the backend is accepting again."""
+    with _dlq_lock:
+        retry = _DLQ[:BATCH_SIZE]
+        del _DLQ[:BATCH_SIZE]
+    if not retry:
+        return
+    ok, _ = send_batch_readings(retry)
+    if not ok:
+        _dead_letter(retry, retry=True)
@@ -1,49 +1,95 @@
 import requests
 import json
-from datetime import datetime
+import os
+import random
+import time
+from requests.adapters import HTTPAdapter
 
-# DO NOT COMMIT
-bearer_token = ""
+try:
+    import orjson
 
-def send_temperature_reading(reading, user_id, sensor_id):
-    base_url = "https://backend.agrogodev.workers.dev/api/data/pings"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {bearer_token}"
-    }
+    def _dumps(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    def _dumps(obj):
+        return json.dumps(obj, separators=(",", ":")).encode()
 
-    payload = {
-        "userId": user_id,
-        # TODO add physical reading once it's been added into the database
-        "sensorId": sensor_id,
-        "time": datetime.now()
-    }
+# Kept out of the source tree, see .gitignore
+TOKEN_PATH = "./persistent_data_store/bearer_token.txt"
+_TOKEN_CACHE = {"value": None, "mtime": 0}
 
-    post_record(base_url, headers, json.dumps(payload))
+MAX_ATTEMPTS = 3
 
-def send_humidity_reading(reading, user_id, sensor_id):
-    base_url = "https://backend.agrogodev.workers.dev/api/data/pings"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {bearer_token}"
-    }
+PINGS_BATCH_URL = "https://backend.agrogodev.workers.dev/api/data/pings/batch"
+SENSORS_URL = "https://backend.agrogodev.workers.dev/api/data/sensors"
 
-    payload = {
-        "userId": user_id,
-        # TODO add physical reading once it's been added into the database
-        "sensorId": sensor_id,
-        "time": datetime.now()
-    }
+# Shared by every request; the Authorization value is refreshed in place by
+# get_bearer_token() whenever the token file changes
+_HEADERS = {
+    "Content-Type": "application/json",
+    "Authorization": "Bearer "
+}
 
-    post_record(base_url, headers, json.dumps(payload))
+# One pooled session for the life of the process so every ping to the
+# worker reuses the same TLS connection instead of re-handshaking.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0))
 
-def send_sensor(user_id, type, zone):
-    base_url = "https://backend.agrogodev.workers.dev/api/data/sensors"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {bearer_token}"
-    }
 
+class _Breaker:
+    """Short-circuits calls to the worker after repeated failures until a cool-off has passed."""
+
+    def __init__(self, threshold=5, cooldown=60):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+
+    def is_open(self):
+        if self.opened_at is None:
+            return False
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return True
+        # Half-open: let one probe through, a single further failure re-opens
+        self.opened_at = None
+        self.failures = self.threshold - 1
+        return False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+    def reset(self):
+        self.failures = 0
+        self.opened_at = None
+
+
+_BREAKER = _Breaker()
+
+
+def get_bearer_token():
+    """Return the worker bearer token, re-reading TOKEN_PATH only when the file changes."""
+    try:
+        mtime = os.stat(TOKEN_PATH).st_mtime_ns
+    except OSError:
+        return ""
+
+    if _TOKEN_CACHE["value"] is None or _TOKEN_CACHE["mtime"] != mtime:
+        with open(TOKEN_PATH, "r") as f:
+            _TOKEN_CACHE["value"] = f.read().strip()
+        _TOKEN_CACHE["mtime"] = mtime
+        _HEADERS["Authorization"] = f"Bearer {_TOKEN_CACHE['value']}"
+    return _TOKEN_CACHE["value"]
+
+
+def send_batch_readings(readings):
+    """Send all readings of one cycle to the worker in a single POST."""
+    payload = {"readings": readings}
+
+    return post_record(PINGS_BATCH_URL, _HEADERS, _dumps(payload))
+
+def send_sensor(user_id, type, zone):
     payload = {
         "userId": user_id,
         # TODO add physical reading once it's been added into the database
@@ -52,16 +98,42 @@ def send_sensor(user_id, type, zone):
     }
     
     # Send data to backend
-    response = post_record(base_url, headers, json.dumps(payload))
-    return response
+    return post_record(SENSORS_URL, _HEADERS, _dumps(payload))
 
 def post_record(base_url, headers, data):
-    try:
-        response = requests.post(base_url, headers=headers, data=data)
-
-        if response.status_code == 200:
-            return "Data send successfully: " + json.dumps(response.json())
-        else:
-            return f"Failed to send data ({response.status_code}): {response.text}"
-    except requests.exceptions.RequestException as e:
-        return "Error sending data: " + e
\ No newline at end of file
+    """POST to the worker, retrying transient failures with jittered exponential backoff.
+
+    Returns (ok, data): the parsed JSON response when ok, else an error message.
+    """
+    if not get_bearer_token():
+        # Every request would be rejected with a 401, don't open a connection
+        return False, "no token, skipping"
+    if _BREAKER.is_open():
+        return False, "circuit open, skipping"
+
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            response = _SESSION.post(base_url, headers=headers, data=data, timeout=(3, 10))
+
+            if response.status_code == 200:
+                _BREAKER.reset()
+                return True, response.json()
+            result = f"Failed to send data ({response.status_code}): {response.text}"
+            if response.status_code in (401, 403):
+                # Bad or revoked token: every call will fail the same way,
+                # let the breaker stop the hammering
+                _BREAKER.record_failure()
+                return False, result
+            if response.status_code < 500:
+                # Client errors won't fix themselves, don't retry
+                return False, result
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            result = f"Error sending data: {e}"
+        except requests.exceptions.RequestException as e:
+            return False, f"Error sending data: {e}"
+
+        if attempt < MAX_ATTEMPTS - 1:
+            time.sleep(min(30, 1.0 * 2 ** attempt) * (1 + random.random() * 0.5))
+
+    _BREAKER.record_failure()
+    return False, result
@@ -1,11 +1,65 @@
+import threading
+import time
+from datetime import datetime, timezone
 from sensors.read_sensors import read_sensors
+from cloud import telemetry
+from startup import PERSIST_PATH, DEFAULT_USER_ID, load_sensor_ids
 
-def display_dashboard(stdscr, start_line):
-    sensor_data = read_sensors()
+SEND_INTERVAL_SECONDS = 15 * 60
+READ_INTERVAL_SECONDS = 1.0
+
+class SensorWorker(threading.Thread):
+    """Reads the sensors and uploads them to D1 off the curses UI thread."""
+
+    def __init__(self, stop_event):
+        super().__init__(daemon=True)
+        self.stop_event = stop_event
+        self.latest = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """Return the most recent sensor readings."""
+        with self._lock:
+            return self.latest
+
+    def run(self):
+        # First upload after a full interval, by which time display_startup
+        # has registered the sensors and sensors.txt holds their ids
+        last_send = time.monotonic()
+        while not self.stop_event.is_set():
+            sensor_data = read_sensors()
+            with self._lock:
+                self.latest = sensor_data
+
+            now = time.monotonic()
+            if now - last_send >= SEND_INTERVAL_SECONDS:
+                self._send(sensor_data)
+                last_send = now
+
+            self.stop_event.wait(READ_INTERVAL_SECONDS)
+
+    def _send(self, sensor_data):
+        sensor_ids = load_sensor_ids(PERSIST_PATH)
+        # One timestamp for the whole cycle, the readings were sampled together
+        ts = datetime.now(timezone.utc).isoformat()
+        for sensor_type, reading in sensor_data.items():
+            sensor_id = sensor_ids.get(sensor_type)
+            if sensor_id is None:
+                # Not registered with the backend (yet), nothing to attach it to
+                continue
+            telemetry.enqueue({
+                "userId": DEFAULT_USER_ID,
+                "sensorId": sensor_id,
+                "reading": reading,
+                "time": ts
+            })
+
+def display_dashboard(stdscr, start_line, worker):
+    sensor_data = worker.snapshot()
 
     stdscr.addstr(start_line, 0, "=== Current Sensor Readings ===")
     
     i = start_line + 1
     for sensor in sensor_data:
         stdscr.addstr(i, 0, f"{sensor}: {sensor_data[sensor]}")
-        i += 1
\ No newline at end of file
+        i += 1
@@ -1,15 +1,15 @@
 import curses
-import time
 from startup import display_startup
-from dashboard import display_dashboard
+from dashboard import display_dashboard, SensorWorker
 import threading
 
 def main(stdscr):
     curses.curs_set(0) # Hide cursor
-    stdscr.nodelay(True) # Don't block on input
+    stdscr.timeout(100) # getch() waits up to 100ms for input, no extra sleep needed
     stop_event = threading.Event()
     
-    # TODO Iniatilize threads
+    worker = SensorWorker(stop_event)
+    worker.start()
     
     state = "startup"
 
@@ -18,15 +18,16 @@ def main(stdscr):
         if state == "startup":
             display_startup(True, stdscr, 0)
         elif state == "dashboard":
-            display_dashboard(stdscr, 0)
+            display_dashboard(stdscr, 0, worker)
         stdscr.addstr(5, 0, "Press 'q' to quit.")
         stdscr.refresh()
 
-        # Non-blocking keypress check
+        # Keypress check, doubles as the frame delay
         key = stdscr.getch()
         if key == ord('q'):
+            stop_event.set()
             break
 
-        time.sleep(0.1) # Buffer to keep from maxing out the CPU
+    worker.join(timeout=2)
 
 curses.wrapper(main)
\ No newline at end of file
@@ -1,6 +1,10 @@
 from .dummy import read_all
 
 def read_sensors():
-    """Returns live sensor readings (dummy for now)"""
+    """Returns live sensor readings (dummy for now).
+
+    Not cached: SensorWorker is the only caller and already paces reads
+    at READ_INTERVAL_SECONDS, everything else renders its snapshot.
+    """
     # TODO: This is dummy data, point this to actual sensors
-    return read_all()
\ No newline at end of file
+    return read_all()
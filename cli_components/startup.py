@@ -2,10 +2,16 @@ from cloud.worker_client import send_sensor
 from sensors import dummy  # TODO: replace with actual data
 from pathlib import Path
 import json
+import os
 
 PERSIST_PATH = "./persistent_data_store/sensors.txt"
 DEFAULT_USER_ID = "73d2c45f-c17b-4d92-9938-34ccf301b78b"
 
+# (path, mtime_ns) -> parsed {sensor type: uuid} map, see load_sensor_ids()
+_UUID_CACHE = {}
+# sensor type -> failed send_sensor response, attempted once per process
+_FAILED_REGISTRATIONS = {}
+
 def display_startup(logged_in, stdscr, start_line=0):
     """Displays the startup menu and registers any new sensors."""
     if not logged_in:
@@ -14,57 +20,111 @@ def display_startup(logged_in, stdscr, start_line=0):
 
     stdscr.addstr(start_line, 0, "User logged in, initializing sensor readings")
     reading = dummy.read_all()
+    sensors = [
+        {"userId": DEFAULT_USER_ID, "type": sensor_type, "zone": f"{sensor_type}_zone"}
+        for sensor_type in reading
+    ]
 
-    # Loop through readings dynamically
-    for i, (sensor_type, value) in enumerate(reading.items(), start=1):
-        sensor = {"userId": DEFAULT_USER_ID, "type": sensor_type, "zone": f"{sensor_type}_zone"}
-        payload = {k: sensor[k] for k in ("userId", "type", "zone")}
+    try:
+        results = save_sensors(sensors, PERSIST_PATH)
+    except OSError as e:
+        stdscr.addstr(start_line + 2, 0, f"Error saving sensors: {e}")
+        return
 
-        result = save_sensors([sensor], PERSIST_PATH, payload)
+    for i, (sensor, resp) in enumerate(results, start=1):
         line_offset = start_line + i + 1
-        if "0 new sensors saved" not in result:
-            resp = send_sensor(DEFAULT_USER_ID, sensor_type, sensor["zone"])
-            stdscr.addstr(line_offset, 0, f"Registered {sensor_type} sensor: {resp}")
-        else:
+        sensor_type = sensor["type"]
+        if resp is None:
             stdscr.addstr(line_offset, 0, f"{sensor_type.capitalize()} sensor already exists locally")
+        else:
+            ok, data = resp
+            status = "Registered" if ok else "Failed to register"
+            stdscr.addstr(line_offset, 0, f"{status} {sensor_type} sensor: {data}")
         stdscr.refresh()
 
 
-def save_sensors(sensors, file_path, payload):
-    """Save sensor data locally and avoid duplicates."""
+def _load_existing_sensor_names(file_path):
+    """Return the set of sensor types already saved in file_path."""
+    # Shares load_sensor_ids' cached parse rather than re-reading the file
+    return set(load_sensor_ids(file_path))
+
+
+def save_sensors(sensors, file_path):
+    """Register sensors not yet saved in file_path and append them to it.
+
+    The file is scanned once and, only if a sensor registers, appended
+    through a single line-buffered handle. Only successful registrations
+    are written. A failed one (no token, circuit open, backend error) is
+    remembered for the rest of this process, so the per-frame redraw
+    shows the same failure instead of re-POSTing; the next startup
+    retries it. Returns (sensor, response) pairs, response being the
+    (ok, data) result of send_sensor, or None for sensors that were
+    already saved.
+    """
     file = Path(file_path)
     file.parent.mkdir(parents=True, exist_ok=True)
-    if not file.exists():
-        file.touch()
+    existing = _load_existing_sensor_names(file)
+
+    results = []
+    out = None
+    try:
+        for sensor in sensors:
+            sensor_type = sensor["type"]
+            if sensor_type in existing:
+                results.append((sensor, None))
+                continue
+            if sensor_type in _FAILED_REGISTRATIONS:
+                results.append((sensor, _FAILED_REGISTRATIONS[sensor_type]))
+                continue
+            resp = send_sensor(sensor["userId"], sensor_type, sensor["zone"])
+            ok, data = resp
+            if ok:
+                if out is None:
+                    out = open(file, "a", buffering=1)
+                uuid = data.get("data", {}).get("sensorId")
+                out.write(json.dumps({**sensor, "uuid": uuid}) + "\n")
+                existing.add(sensor_type)
+            else:
+                _FAILED_REGISTRATIONS[sensor_type] = resp
+            results.append((sensor, resp))
+    finally:
+        if out is not None:
+            out.close()
+    return results
 
-    existing_sensors = {}
+
+def load_sensor_ids(file_path):
+    """Return a {sensor type: uuid} map of the sensors saved locally.
+
+    The parsed map is cached until the file's mtime changes.
+    """
     try:
-        with open(file, "r") as f:
-            for line in f:
-                try:
-                    rec = json.loads(line)
-                    if rec.get("uuid"):
-                        existing_sensors[rec["uuid"]] = rec
-                except json.JSONDecodeError:
-                    continue
-    except Exception as e:
-        return f"Error reading file: {e}"
-
-    new_records = []
-    for sensor in sensors:
-        uuid = sensor.get("uuid")
-        if uuid and uuid in existing_sensors:
-            continue
-        new_records.append({**payload, "uuid": uuid})
-
-    if not new_records:
-        return "0 new sensors saved"
+        key = (str(file_path), os.stat(file_path).st_mtime_ns)
+    except FileNotFoundError:
+        return {}
+    if key in _UUID_CACHE:
+        return _UUID_CACHE[key]
 
+    with open(file_path, "r") as f:
+        lines = [line for line in f.read().splitlines() if line.strip()]
     try:
-        with open(file, "a") as f:
-            for rec in new_records:
-                f.write(json.dumps(rec) + "\n")
-    except Exception as e:
-        return f"Error writing to file: {e}"
+        # One decoder pass over the whole file instead of json.loads per line
+        records = json.loads("[" + ",".join(lines) + "]")
+    except json.JSONDecodeError:
+        # A corrupt line, fall back to skipping just the bad records
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+
+    sensor_ids = {
+        rec["type"]: rec.get("uuid")
+        for rec in records
+        if isinstance(rec, dict) and rec.get("type")
+    }
 
-    return f"{len(new_records)} new sensors saved"
+    _UUID_CACHE.clear()
+    _UUID_CACHE[key] = sensor_ids
+    return sensor_ids
@@ -7,7 +7,7 @@ main.py
   - Read DHT11 sensor on GPIO 15 periodically.
   - Execute scheduled actions from pinActionTable.
   - Evaluate sensor-based triggers in the pinActionTable as well if present.
-  - Upload telemetry to backend.
+  - Buffer telemetry and upload it to backend in batches.
   - Persist last known config to local config.json.
 
 Notes:
@@ -22,36 +22,51 @@ Notes:
     "value": 75.0
   }
 - Scheduling behavior:
-  - If "time" present, action runs when local HH:MM matches current time (checked every loop)
-  - Prevent repeated triggers within the same minute using in-memory 'recent_runs'
+  - Sensor reads, the minute scheduler, config refetch and telemetry upload
+    run as independent asyncio tasks on one event loop; blocking DHT reads
+    and HTTP calls go through asyncio.to_thread so they never stall the loop.
+  - If "time" present, action runs when local HH:MM matches current time
+    (checked once at the top of every minute)
+  - The scheduler sleeps to each minute boundary, so every minute is checked
+    exactly once; sensor-rule cooldowns are tracked in in-memory 'recent_runs'
 - Requirements:
-  - Adafruit_DHT (pip package 'Adafruit_DHT' or system package)
-  - RPi.GPIO
+  - adafruit-circuitpython-dht (imported as adafruit_dht, with board)
+  - lgpio (GPIO via the /dev/gpiochip0 character device)
   - requests
+  - No numpy: pin tables are compared as canonical JSON in pure Python
 """
+import asyncio
+import collections
+import os
 import time
-import threading
 import datetime
+import json
+import operator
 import traceback
+from zoneinfo import ZoneInfo
 
-import RPi.GPIO as GPIO
+import lgpio
 import adafruit_dht
 import board
-import numpy as np
-import pytz
 
 from utils import (
+    PENDING_PATH,
     get_mac,
     load_local_config,
     save_local_config,
     http_get_json,
     http_post_json,
+    http_post_msgpack,
     log_info,
 )
 
 # ---------- Hardware pin definitions (BCM numbering) ----------
 DHT_PIN = board.D15  # DHT11 data line on GPIO 15
 dht_device = adafruit_dht.DHT11(DHT_PIN, use_pulseio=False)
+DHT_MIN_INTERVAL = 2.0  # the sensor has no newer sample before this
+DHT_MAX_STALE = 90  # seconds a failed read may fall back to the last good one
+_last_dht_at = 0.0
+_last_dht_value = {}
 
 PIN_MAP = {
     "fan": 17,
@@ -61,86 +76,137 @@ PIN_MAP = {
 }
 CONTROL_PINS = list(PIN_MAP.values())
 
+# Sensor rule key -> time.monotonic() of its last trigger, for cooldowns
 recent_runs = {}
-gpio_lock = threading.Lock()
-
-GPIO.setmode(GPIO.BCM)
-GPIO.setwarnings(False)
+SCHED_BY_TIME = {}
+SENSOR_RULES = []
+pin_timers = {}  # pin -> asyncio.TimerHandle that sets it LOW
+
+# Output lines are claimed through the kernel GPIO character device
+# (BCM numbering on gpiochip0). No lock around gpio_write: each call is a
+# single line-value ioctl, atomic per pin.
+GPIO_CHIP = lgpio.gpiochip_open(0)
 for p in CONTROL_PINS:
-    GPIO.setup(p, GPIO.OUT, initial=GPIO.LOW)
+    lgpio.gpio_claim_output(GPIO_CHIP, p, 0)
 
 # ---------- Timezone setup ----------
-LOCAL_TZ = pytz.timezone("America/Detroit")
+LOCAL_TZ = ZoneInfo("America/Detroit")
 
 ALERT_URL = "https://backend.agrogodev.workers.dev/raspi/alert"
 
+# ---------- Telemetry buffering ----------
+# Readings are uploaded in one POST once this many are buffered or the
+# oldest unsent one is this old, whichever comes first.
+TELEMETRY_FLUSH_COUNT = 12
+TELEMETRY_FLUSH_SECONDS = 300
+# After a failed upload wait this long before the next attempt, doubling
+# on every consecutive failure up to the cap
+UPLOAD_RETRY_BASE_SECONDS = 15
+UPLOAD_RETRY_MAX_SECONDS = 900
+PENDING = collections.deque(maxlen=1024)
+_pending_fh = None  # append handle on PENDING_PATH, reopened after each rewrite
+
 # ---------- Helper functions ----------
-def activate_pin(pin: int, duration: float):
-    """Activate GPIO pin HIGH for 'duration' seconds, then LOW."""
-    def _worker():
-        try:
-            with gpio_lock:
-                log_info(f"[GPIO] Activating pin {pin} HIGH for {duration}s")
-                GPIO.output(pin, GPIO.HIGH)
-            time.sleep(duration)
-        except Exception as e:
-            log_info(f"[GPIO] Error in activation worker: {e}")
-        finally:
-            with gpio_lock:
-                try:
-                    GPIO.output(pin, GPIO.LOW)
-                    log_info(f"[GPIO] Pin {pin} set LOW after {duration}s")
-                except Exception as e:
-                    log_info(f"[GPIO] Error setting pin LOW: {e}")
-    threading.Thread(target=_worker, daemon=True).start()
+def set_pin_low(pin: int):
+    """Drive pin LOW and forget its pending deactivation timer."""
+    pin_timers.pop(pin, None)
+    try:
+        lgpio.gpio_write(GPIO_CHIP, pin, 0)
+        log_info(f"[GPIO] Pin {pin} set LOW")
+    except Exception as e:
+        log_info(f"[GPIO] Error setting pin LOW: {e}")
 
 
-def should_run_scheduled_action(entry, now):
-    """Return True if entry should run this minute based on its time field."""
-    when = entry.get("time")
-    if not when:
-        return False
+def activate_pin(pin: int, duration: float):
+    """
+    Activate GPIO pin HIGH now and schedule it LOW after 'duration' seconds.
+    The LOW transition sits on the event loop's timer heap, so concurrent
+    activations cost no thread or task each. Re-activating a pin that is
+    still HIGH restarts its timer.
+    """
     try:
-        hh_mm = when.strip()
-        now_str = now.strftime("%H:%M")
-        if hh_mm != now_str:
-            return False
-        entry_key = f"scheduled:{entry.get('type')}:{entry.get('pin')}:{when}"
-        last = recent_runs.get(entry_key)
-        if last and int(last // 60) == int(now.timestamp() // 60):
-            return False
-        recent_runs[entry_key] = now.timestamp()
-        return True
+        log_info(f"[GPIO] Activating pin {pin} HIGH for {duration}s")
+        lgpio.gpio_write(GPIO_CHIP, pin, 1)
     except Exception as e:
-        log_info(f"[sched] Error parsing scheduled time '{when}': {e}")
-        return False
+        log_info(f"[GPIO] Error activating pin {pin}: {e}")
+    previous = pin_timers.pop(pin, None)
+    if previous:
+        previous.cancel()
+    pin_timers[pin] = asyncio.get_running_loop().call_later(duration, set_pin_low, pin)
+
+
+def release_all_pins():
+    """Cancel pending deactivation timers and drive their pins LOW now."""
+    for pin, handle in list(pin_timers.items()):
+        handle.cancel()
+        set_pin_low(pin)
+
+
+# trigger string -> (comparison, reading key)
+TRIGGERS = {
+    "temp_above": (operator.gt, "temperature"),
+    "temp_below": (operator.lt, "temperature"),
+    "humidity_above": (operator.gt, "humidity"),
+    "humidity_below": (operator.lt, "humidity"),
+}
 
 
-def should_run_sensor_trigger(entry, readings):
-    """Evaluate sensor-based triggers like temp_above, humidity_below, etc."""
-    trig = entry.get("trigger")
-    value = entry.get("value")
-    if not trig or value is None:
-        return False
+def make_sensor_predicate(trig, value):
+    """Return a readings -> bool check for a trigger string, or None if unknown."""
+    op, key = TRIGGERS.get(trig, (None, None))
+    if op is None:
+        return None
+
+    def predicate(readings):
+        v = readings.get(key)
+        return v is not None and op(v, value)
+
+    return predicate
 
-    temp = readings.get("temperature")
-    humidity = readings.get("humidity")
-
-    condition = False
-    if trig == "temp_above" and temp is not None:
-        condition = temp > value
-    elif trig == "temp_below" and temp is not None:
-        condition = temp < value
-    elif trig == "humidity_above" and humidity is not None:
-        condition = humidity > value
-    elif trig == "humidity_below" and humidity is not None:
-        condition = humidity < value
-    if not condition:
+
+def compile_pin_table(pin_table):
+    """
+    Index pinActionTable once per fetch so the loops do no per-entry parsing:
+    SCHED_BY_TIME maps "HH:MM" -> [(pin, duration)] and
+    SENSOR_RULES holds (predicate, pin, duration, entry_key, cooldown, trigger).
+    """
+    global SCHED_BY_TIME, SENSOR_RULES
+    sched_by_time = {}
+    sensor_rules = []
+    for entry in pin_table:
+        try:
+            pin = int(entry.get("pin"))
+            duration = int(entry.get("duration", 30))
+
+            when = entry.get("time")
+            if when:
+                sched_by_time.setdefault(when.strip(), []).append((pin, duration))
+
+            trig = entry.get("trigger")
+            value = entry.get("value")
+            predicate = make_sensor_predicate(trig, value) if value is not None else None
+            if predicate:
+                entry_key = ("t", entry.get("type"), entry.get("pin"), trig, value)
+                cooldown = entry.get("cooldown", max(60, entry.get("duration", 60)))
+                sensor_rules.append((predicate, pin, duration, entry_key, cooldown, trig))
+        except Exception as e:
+            log_info(f"[main] Skipping invalid pinActionTable entry {entry}: {e}")
+    SCHED_BY_TIME = sched_by_time
+    SENSOR_RULES = sensor_rules
+
+    # Forget runs of entries that are no longer in the table so recent_runs
+    # stays bounded by the live table size
+    live_keys = {rule[3] for rule in sensor_rules}
+    for key in [k for k in list(recent_runs) if k not in live_keys]:
+        recent_runs.pop(key, None)
+
+
+def should_run_sensor_trigger(predicate, readings, entry_key, cooldown):
+    """Evaluate a compiled sensor rule, honoring its cooldown."""
+    if not predicate(readings):
         return False
 
-    entry_key = f"sensor:{entry.get('type')}:{entry.get('pin')}:{trig}:{value}"
-    now_ts = time.time()
-    cooldown = entry.get("cooldown", max(60, entry.get("duration", 60)))
+    now_ts = time.monotonic()
     last = recent_runs.get(entry_key)
     if last and (now_ts - last) < cooldown:
         return False
@@ -149,40 +215,113 @@ def should_run_sensor_trigger(entry, readings):
 
 
 def read_dht11():
-    """Read DHT11 sensor safely and return dict of readings."""
+    """
+    Read DHT11 sensor safely and return (readings, fresh).
+    The DHT11 only produces a new sample roughly every 2s and its reads
+    fail intermittently. Within DHT_MIN_INTERVAL of the last good read,
+    or after a failed read, the last good reading is returned with
+    fresh=False as long as it is at most DHT_MAX_STALE seconds old, so
+    sensor rules keep working through a bad tick without the same
+    sample being buffered again as new telemetry.
+    """
+    global _last_dht_at, _last_dht_value
+    now = time.monotonic()
+    if _last_dht_value and now - _last_dht_at < DHT_MIN_INTERVAL:
+        return _last_dht_value, False
+
     try:
+        # Each property calls adafruit_dht's measure(), which only pulses the
+        # sensor once per 2s, so reading both costs a single start pulse
         temperature_c = dht_device.temperature
         humidity = dht_device.humidity
         if temperature_c is None or humidity is None:
             log_info("[sensor] DHT11 returned None values.")
-            return {}
+            return _last_dht_reading(now)
         log_info(f"[sensor] DHT11 reading: Temp={temperature_c:.1f}°C  Humidity={humidity:.1f}%")
-        return {"temperature": temperature_c, "humidity": humidity}
+        _last_dht_value = {"temperature": temperature_c, "humidity": humidity}
+        _last_dht_at = now
+        return _last_dht_value, True
     except RuntimeError as e:
         log_info(f"[sensor] RuntimeError during read: {e}")
-        time.sleep(2)
-        return {}
+        return _last_dht_reading(now)
     except Exception as e:
         log_info(f"[sensor] Unexpected exception: {e}")
         try:
             dht_device.exit()
         except Exception:
             pass
-        time.sleep(2)
-        return {}
+        return _last_dht_reading(now)
+
+
+def _last_dht_reading(now):
+    """Fall back to the last good reading while it is recent enough."""
+    if _last_dht_value and now - _last_dht_at <= DHT_MAX_STALE:
+        return _last_dht_value, False
+    return {}, False
+
+def load_pending_readings():
+    """Reload readings buffered by a previous run that were never uploaded."""
+    try:
+        with open(PENDING_PATH, "r") as fh:
+            for line in fh:
+                try:
+                    PENDING.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    except FileNotFoundError:
+        pass
+    if PENDING:
+        log_info(f"[upload] Restored {len(PENDING)} buffered readings from disk")
+
+
+def buffer_reading(sample: dict):
+    """Queue a reading for the next batch upload and mirror it to disk."""
+    global _pending_fh
+    PENDING.append(sample)
+    try:
+        if _pending_fh is None:
+            # Line-buffered: each sample is one write, with no open/close per sample
+            _pending_fh = open(PENDING_PATH, "a", buffering=1)
+        _pending_fh.write(json.dumps(sample) + "\n")
+    except OSError as e:
+        log_info(f"[upload] Could not persist buffered reading: {e}")
+
+
+def save_pending_readings():
+    """
+    Rewrite the on-disk buffer so it matches PENDING after a flush.
+    Written to a temp file and renamed over the old one, so a power cut
+    mid-rewrite can't truncate the unsent samples.
+    """
+    global _pending_fh
+    tmp_path = PENDING_PATH + ".tmp"
+    try:
+        with open(tmp_path, "w") as fh:
+            fh.writelines(json.dumps(sample) + "\n" for sample in PENDING)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, PENDING_PATH)
+    except OSError as e:
+        log_info(f"[upload] Could not persist buffered readings: {e}")
+        return
+    # The append handle still points at the replaced file
+    if _pending_fh is not None:
+        _pending_fh.close()
+        _pending_fh = None
+
+
 def fetch_remote_config(config_url: str) -> dict:
     log_info(f"[main] Fetching config from {config_url}")
-    return http_get_json(config_url, timeout=10)
+    return http_get_json(config_url)
 
 def compare_pin_tables(old_table, new_table) -> bool:
     try:
         log_info(f"[compare] Old pinActionTable: {old_table}")
         log_info(f"[compare] New pinActionTable: {new_table}")
-        old_arr = np.array(old_table, dtype=object)
-        new_arr = np.array(new_table, dtype=object)
-        if old_arr.shape != new_arr.shape:
-            return True
-        return not np.array_equal(old_arr, new_arr)
+        # Canonical JSON so equivalent entries with reordered keys compare equal
+        old_json = json.dumps(old_table, sort_keys=True)
+        new_json = json.dumps(new_table, sort_keys=True)
+        return old_json != new_json
     except Exception as e:
         log_info(f"[compare] Error comparing pin tables: {e}")
         return True
@@ -200,7 +339,14 @@ def notify_backend_change(firebase_uid: str):
         log_info(f"[notify] Failed to send update: {e}")
 
 # ---------- Main ----------
-def main():
+def seconds_until_next_minute() -> float:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    next_minute = now.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+    # Small margin so we wake just after the boundary, never just before it
+    return (next_minute - now).total_seconds() + 0.5
+
+
+async def main():
     log_info("[main] Starting main runtime")
     cfg = load_local_config()
 
@@ -218,6 +364,12 @@ def main():
     )
 
     def fetch_and_store_config():
+        """
+        Fetch the pin table and persist it if it changed. Runs in a worker
+        thread, so it only returns the new table (None if unchanged or on
+        error); the caller compiles it back on the event loop, which is the
+        only thread that touches SCHED_BY_TIME/SENSOR_RULES/recent_runs.
+        """
         try:
             config_url = config_url_template.format(mac=mac)
             remote_cfg = fetch_remote_config(config_url)
@@ -235,77 +387,149 @@ def main():
                     notify_backend_change(firebase_uid)
                 else:
                     log_info("[main] No Firebase UID found, skipping notification.")
-            else:
-                log_info("[main] No change detected in pinActionTable.")
-                return True
+                return new_pin_table
+            log_info("[main] No change detected in pinActionTable.")
         except Exception as e:
             log_info(f"[main] Error fetching config: {e}")
-        return False
-   
-    # Initial fetch
-    fetch_and_store_config()
+        return None
+
+    # The backend opts in to the compact binary upload format via config
+    post_upload = http_post_msgpack if backend_cfg.get("upload_format") == "msgpack" else http_post_json
+    compress_uploads = bool(backend_cfg.get("upload_gzip", False))
+
+    def upload_telemetry(batch):
+        try:
+            upload_url = upload_url_template.format(mac=mac)
+            payload = {"deviceId": mac, "readings": batch}
+            post_upload(upload_url, payload, compress=compress_uploads)
+            log_info(f"[upload] {len(batch)} readings uploaded to {upload_url}")
+            return True
+        except Exception as e:
+            log_info(f"[upload] Failed to upload telemetry: {e}")
+            return False
+
+    last_flush = time.monotonic()
+    flush_wanted = asyncio.Event()
+
+    async def upload_task():
+        # Sole owner of telemetry uploads; sensor_task only signals it, so a
+        # slow backend never delays reads or GPIO work
+        retry_delay = UPLOAD_RETRY_BASE_SECONDS
+        while True:
+            await flush_wanted.wait()
+            flush_wanted.clear()
+            if not PENDING:
+                continue
+            batch = list(PENDING)
+            PENDING.clear()
+            ok = await asyncio.to_thread(upload_telemetry, batch)
+            if not ok:
+                # Put the batch back ahead of anything sampled meanwhile
+                remaining = batch + list(PENDING)
+                PENDING.clear()
+                PENDING.extend(remaining)
+            save_pending_readings()
+            if ok:
+                retry_delay = UPLOAD_RETRY_BASE_SECONDS
+            else:
+                log_info(f"[upload] Retrying in {retry_delay}s")
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, UPLOAD_RETRY_MAX_SECONDS)
+
+    load_pending_readings()
+
+    # Initial fetch, falling back to the locally saved table
+    compile_pin_table(cfg.get("pinActionTable", []))
+    new_pin_table = await asyncio.to_thread(fetch_and_store_config)
+    if new_pin_table is not None:
+        compile_pin_table(new_pin_table)
 
     sampling_interval = int(cfg.get("samplingInterval", 30))
     config_refetch_interval = int(cfg.get("configRefetchInterval", 30))
-    last_config_refetch = time.time()
 
-    try:
+    async def sensor_task():
+        nonlocal last_flush
         while True:
-            loop_start = time.time()
-            now = datetime.datetime.now(datetime.timezone.utc).astimezone(LOCAL_TZ)
-
-            if (time.time() - last_config_refetch) > config_refetch_interval:
-                log_info("[main] Checking for backend config updates...")
-                if fetch_and_store_config():
-                    cfg = load_local_config()
-                last_config_refetch = time.time()
-              
-            pin_table = cfg.get("pinActionTable", [])
-            readings = read_dht11()
+            loop_start = time.monotonic()
+            readings, fresh = await asyncio.to_thread(read_dht11)
             if readings:
-                log_info(f"[main] Sensor readings: {readings}")
+                label = "Sensor readings" if fresh else "Reusing last sensor readings"
+                log_info(f"[main] {label}: {readings}")
             else:
                 log_info("[main] No sensor readings this loop.")
-            for entry in pin_table:
-                    try:
-                        if should_run_scheduled_action(entry, now):
-                            pin = int(entry.get("pin"))
-                            duration = int(entry.get("duration", 30))
-                            activate_pin(pin, duration)
-                            log_info(f"[sched] Scheduled action triggered for pin {pin} duration={duration}")
 
-                        if readings and should_run_sensor_trigger(entry, readings):
-                            pin = int(entry.get("pin"))
-                            duration = int(entry.get("duration", 30))
+            if readings:
+                for predicate, pin, duration, entry_key, cooldown, trig in SENSOR_RULES:
+                    try:
+                        if should_run_sensor_trigger(predicate, readings, entry_key, cooldown):
                             activate_pin(pin, duration)
-                            log_info(f"[sensor-trigger] Triggered pin {pin} due to sensor rule: {entry.get('trigger')}")
+                            log_info(f"[sensor-trigger] Triggered pin {pin} due to sensor rule: {trig}")
                     except Exception as e:
-                        log_info(f"[main] Error evaluating entry {entry}: {e}")
+                        log_info(f"[main] Error evaluating sensor rule {entry_key}: {e}")
                         log_info(traceback.format_exc())
-                
-                # Upload telemetry
-            upload_url = upload_url_template.format(mac=mac)
-            try:
-                if readings:
-                    upload_url = upload_url_template.format(mac=mac)
-                    payload = {"reading": str(readings)}
-                    http_post_json(upload_url, payload, timeout=10)
-                    log_info(f"[upload] Telemetry uploaded to {upload_url}")
-            except Exception as e:
-                log_info(f"[upload] Failed to upload telemetry: {e}")
-                            
-            elapsed = time.time() - loop_start
-            sleep_for = max(1, sampling_interval - int(elapsed))
-            time.sleep(sleep_for)
 
-    except KeyboardInterrupt:
+                # Only new samples become telemetry; a reused one was already buffered
+                if fresh:
+                    now_iso = datetime.datetime.now(datetime.timezone.utc).isoformat()
+                    buffer_reading({"ts": now_iso, **readings})
+
+            due = (
+                len(PENDING) >= TELEMETRY_FLUSH_COUNT
+                or time.monotonic() - last_flush > TELEMETRY_FLUSH_SECONDS
+            )
+            if PENDING and due:
+                last_flush = time.monotonic()
+                flush_wanted.set()
+
+            elapsed = time.monotonic() - loop_start
+            await asyncio.sleep(max(1, sampling_interval - int(elapsed)))
+
+    async def scheduler_task():
+        last_hhmm = None
+        while True:
+            now = datetime.datetime.now(datetime.timezone.utc).astimezone(LOCAL_TZ)
+            now_hhmm = now.strftime("%H:%M")
+            # One wake per minute; the guard only matters if the clock steps back
+            if now_hhmm != last_hhmm:
+                last_hhmm = now_hhmm
+                for pin, duration in SCHED_BY_TIME.get(now_hhmm, ()):
+                    activate_pin(pin, duration)
+                    log_info(f"[sched] Scheduled action triggered for pin {pin} duration={duration}")
+            await asyncio.sleep(seconds_until_next_minute())
+
+    async def config_task():
+        # fetch_and_store_config updates cfg in place, so there is nothing
+        # to re-read from disk afterwards
+        while True:
+            await asyncio.sleep(config_refetch_interval)
+            log_info("[main] Checking for backend config updates...")
+            new_pin_table = await asyncio.to_thread(fetch_and_store_config)
+            if new_pin_table is not None:
+                compile_pin_table(new_pin_table)
+
+    tasks = [
+        asyncio.create_task(sensor_task()),
+        asyncio.create_task(scheduler_task()),
+        asyncio.create_task(config_task()),
+        asyncio.create_task(upload_task()),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
         log_info("[main] KeyboardInterrupt received, cleaning up GPIO and exiting.")
     except Exception as e:
         log_info(f"[main] Unhandled exception: {e}")
         log_info(traceback.format_exc())
     finally:
-        GPIO.cleanup()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        release_all_pins()
+        lgpio.gpiochip_close(GPIO_CHIP)
         log_info("[main] Shutdown complete.")
 
 if __name__ == "__main__":
-    main()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -4,24 +4,46 @@ pairing.py
 - Polls backend pairing-check endpoint until backend reports mapping (firebaseUid)
   for this MAC. Once pairing confirmed, writes firebaseUid to local config.json.
 - Backend endpoints expected:
-  - GET "URL"
+  - GET "URL"?wait=<seconds>
     returns { "firebaseUid": "firebase|UUID..." } when paired, else {} / 404 / 204.
+    Long-poll: the server may hold the request open up to "wait" seconds and
+    answer as soon as pairing completes.
 """
 
 import os
+import io
 import time
 import uuid
+import hashlib
 import secrets
-import qrcode
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from utils import get_mac, load_local_config, save_local_config, log_info
 
 # Backend pairing status endpoint
 PAIRING_STATUS_URL_TEMPLATE = "https://backend.agrogodev.workers.dev/raspi/{mac}/pairingStatus"
 
-# Poll interval (seconds)
+# Minimum spacing between polls (seconds), for servers that answer a long-poll immediately
 POLL_INTERVAL = 8
 
+# How long the server may hold a pairing-status request open (seconds)
+LONG_POLL_WAIT = 60
+
+# Long-poll session: connection errors and 5xx are still retried, but a read
+# timeout (an expired long-poll) is raised straight away as ReadTimeout so
+# wait_for_pairing can re-poll instead of urllib3 silently re-sending it
+POLL_SESSION = requests.Session()
+POLL_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        max_retries=Retry(total=3, read=False, backoff_factor=0.5, status_forcelist=[502, 503, 504]),
+    ),
+)
+
+# Rendered QR codes, keyed by a hash of the pairing URL
+QR_CACHE_DIR = os.path.expanduser("~/.cache/agrogo")
+
 
 #def generate_nonce():
     #return secrets.token_urlsafe(16)
@@ -31,24 +53,53 @@ def build_pairing_url(mac: str) -> str:
     return f"https://agrogo-wsu.github.io/device-pairing?mac={mac}" #&nonce={nonce}
 
 def show_qr_terminal(url: str) -> None:
-    # Use qrcode to create ASCII QR
+    # The URL only depends on the MAC, so reuse the QR rendered on a previous boot
+    digest = hashlib.sha1(url.encode()).hexdigest()[:16]
+    cache_path = os.path.join(QR_CACHE_DIR, f"qr_{digest}.txt")
+    try:
+        with open(cache_path, "r") as fh:
+            cached = fh.read()
+        if cached:
+            print(cached, end="", flush=True)
+            return
+    except OSError:
+        pass
+
+    # Use qrcode to create ASCII QR (imported here so cached boots skip it)
+    import qrcode
     qr = qrcode.QRCode(border=1)
     qr.add_data(url)
     qr.make(fit=True)
-    # Print ASCII QR (inverting makes it easier to scan on dark terminal backgrounds)
-    qr.print_ascii(invert=True)
+    # Render ASCII QR (inverting makes it easier to scan on dark terminal backgrounds)
+    buf = io.StringIO()
+    qr.print_ascii(out=buf, invert=True)
+    ascii_qr = buf.getvalue()
+    print(ascii_qr, end="", flush=True)
+
+    try:
+        os.makedirs(QR_CACHE_DIR, exist_ok=True)
+        # Write then rename so a power cut can't leave a truncated, unscannable QR
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "w") as fh:
+            fh.write(ascii_qr)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        log_info(f"[pairing] Could not cache QR code: {e}")
 
 
 def wait_for_pairing(mac: str):
     """
-    Polls backend for pairing status. Server should verify nonce and return firebaseUid.
+    Long-polls backend for pairing status. Server should verify nonce and return firebaseUid.
     Response example: { "firebaseUid": "firebase|abc123", "message": "paired" }
     """
     log_info(f"[pairing] Polling pairing status for MAC={mac}")
     url = PAIRING_STATUS_URL_TEMPLATE.format(mac=mac)
     while True:
+        started = time.monotonic()
         try:
-            resp = requests.get(url, timeout=10)
+            resp = POLL_SESSION.get(url, params={"wait": LONG_POLL_WAIT}, timeout=(3, LONG_POLL_WAIT + 5))
             if resp.status_code == 200:
                 j = resp.json()
                 firebase_uid = j.get("firebaseUUID") or j.get("firebaseUid") or j.get("user")
@@ -58,9 +109,15 @@ def wait_for_pairing(mac: str):
             else:
                 # server might return 204 / 404 if not found — continue polling
                 log_info(f"[pairing] pairing check status: {resp.status_code}")
+        except requests.exceptions.ReadTimeout:
+            # Long-poll expired with nothing to report, ask again
+            continue
         except Exception as e:
             log_info(f"[pairing] Error contacting server: {e}")
-        time.sleep(POLL_INTERVAL)
+        # Servers that ignore "wait" answer right away, keep the old poll spacing for them
+        remaining = POLL_INTERVAL - (time.monotonic() - started)
+        if remaining > 0:
+            time.sleep(remaining)
 
 
 def main():
@@ -3,15 +3,15 @@ startup.py
 - Entry script run at boot (systemd).
 - Loads local config. If not paired -> runs pairing.py.
   If paired -> runs main.py.
-- Keeps things simple: uses subprocess.run to execute child scripts
-  so logs appear in stdout/stderr (captured by systemd -> logs/app.log).
+- Pairing runs as a short-lived child via subprocess.run; main.py then
+  replaces this process with os.execv so only one interpreter stays
+  resident. Logs still go to stdout/stderr (captured by systemd).
 """
 import os
 import sys
 import subprocess
 import time
-import pytz
-from utils import load_local_config, save_local_config, get_mac, log_info
+from utils import load_local_config, save_local_config, get_mac, log_info, flush_logs
 
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
 PAIRING_SCRIPT = os.path.join(APP_DIR, "pairing.py")
@@ -30,7 +30,8 @@ def main():
         mac = get_mac()
         if mac:
             config["mac"] = mac
-            save_local_config(config)
+            # Recomputed on every boot if lost, no need to force it to flash
+            save_local_config(config, durable=False)
             log_info(f"[startup] Saved device MAC address: {mac}")
         else:
             log_info("[startup] ERROR: Could not determine MAC address.")
@@ -54,7 +55,10 @@ def main():
     if paired:
         log_info("[startup] Device is paired. Launching main.py...")
         time.sleep(2)  # optional short delay
-        subprocess.run([sys.executable, MAIN_SCRIPT])
+        # Nothing left to do here, so hand the process over to main.py
+        # rather than keeping a second interpreter alive to wait on it
+        flush_logs()
+        os.execv(sys.executable, [sys.executable, MAIN_SCRIPT])
     else:
         log_info("[startup] Pairing not completed. Exiting.")
 
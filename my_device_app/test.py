@@ -1,5 +1,5 @@
-import RPi.GPIO as GPIO
-import time
+import asyncio
+import lgpio
 
 PIN_MAP = {
     "fan": 17,
@@ -8,28 +8,37 @@ PIN_MAP = {
     "water_3": 23
 }
 
-GPIO.setmode(GPIO.BCM)
-GPIO.setwarnings(False)
-
-for p in PIN_MAP.values():
-    GPIO.setup(p, GPIO.OUT, initial=GPIO.LOW)
-
-print("GPIO pin Test Started — Press Ctrl+C to stop\n")
-
-try:
-    while True:
-        for name, pin in PIN_MAP.items():
-            print(f"Activating {name} on GPIO {pin}")
-            GPIO.output(pin, GPIO.HIGH)
-            time.sleep(5)  # ON duration
-            GPIO.output(pin, GPIO.LOW)
-            print(f"{name} OFF\n")
-            time.sleep(2)  # OFF delay
-
-except KeyboardInterrupt:
-    print("\nTest stopped by user.")
-
-finally:
-    GPIO.cleanup()
-    print("GPIO cleaned up. All pins set to LOW.")
-
+CONTROL_PINS = tuple(PIN_MAP.values())
+
+# Same backend as main.py: gpiochip0 line offsets are BCM numbers
+chip = lgpio.gpiochip_open(0)
+for p in CONTROL_PINS:
+    lgpio.gpio_claim_output(chip, p, 0)
+
+
+async def main():
+    print("GPIO pin Test Started — Press Ctrl+C to stop\n")
+    # Bind the per-pin calls once instead of looking them up every cycle
+    write, sleep = lgpio.gpio_write, asyncio.sleep
+    pins = tuple(PIN_MAP.items())
+    try:
+        while True:
+            for name, pin in pins:
+                print(f"Activating {name} on GPIO {pin}")
+                write(chip, pin, 1)
+                await sleep(5)  # ON duration
+                write(chip, pin, 0)
+                print(f"{name} OFF\n")
+                await sleep(2)  # OFF delay
+    finally:
+        for p in CONTROL_PINS:
+            lgpio.gpio_write(chip, p, 0)
+        lgpio.gpiochip_close(chip)
+        print("GPIO cleaned up. All pins set to LOW.")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nTest stopped by user.")
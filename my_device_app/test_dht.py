@@ -1,15 +1,30 @@
-import time
+import asyncio
 import adafruit_dht
 import board
 
 # DHT11 on GPIO15 (pin 10)
 dht_device = adafruit_dht.DHT11(board.D15, use_pulseio=False)
 
-while True:
+
+def read_dht():
+    # Each property calls adafruit_dht's measure(), which only pulses the
+    # sensor once per 2s, so reading both costs a single start pulse
+    return dht_device.temperature, dht_device.humidity
+
+
+async def main():
+    while True:
+        try:
+            # The read bit-bangs the sensor, keep it off the event loop
+            temperature, humidity = await asyncio.to_thread(read_dht)
+            print(f"Temp: {temperature:.1f}°C, Humidity: {humidity:.1f}%")
+        except Exception as e:
+            print("Sensor read error:", e)
+        await asyncio.sleep(2)
+
+
+if __name__ == "__main__":
     try:
-        temperature = dht_device.temperature
-        humidity = dht_device.humidity
-        print(f"Temp: {temperature:.1f}°C, Humidity: {humidity:.1f}%")
-    except Exception as e:
-        print("Sensor read error:", e)
-    time.sleep(2)
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
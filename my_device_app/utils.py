@@ -4,31 +4,81 @@ utils.py
   - get_mac(): returns MAC address as string XX:XX:...
   - load_local_config(), save_local_config() for persistent config storage
   - HTTP helper wrappers (simple)
-  - basic logging helper that writes to stdout and app.log
+  - basic logging helper that writes to stdout and a rotating device.log
 """
 
 import os
+import sys
 import json
+import logging
+import signal
+import functools
+import hashlib
 import uuid
-import tempfile
+import threading
 import time
-import pytz
-from datetime import datetime, timezone
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from logging.handlers import RotatingFileHandler
 from typing import Dict, Any
 
-CONFIG_PATH = "/home/agrogodev/my_device_app/config.json"
-LOG_PATH = "/home/agrogodev/my_device_app/logs/app.log"
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+
+    def _loads(raw: bytes):
+        return orjson.loads(raw)
+
+    def _dumps_compact(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    def _dumps_config(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    def _loads(raw: bytes):
+        return json.loads(raw)
+
+    def _dumps_compact(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    def _dumps_config(obj) -> bytes:
+        return json.dumps(obj, indent=2).encode()
+
+# Paths can be overridden from the environment (e.g. in the systemd unit)
+CONFIG_PATH = os.environ.get("AGROGO_CONFIG", "/home/agrogodev/my_device_app/config.json")
+# Rotated by this process, so it must not be the file systemd appends
+# stdout/stderr to (logs/app.log): renaming that would orphan systemd's fd
+LOG_PATH = os.environ.get("AGROGO_LOG", "/home/agrogodev/my_device_app/logs/device.log")
+PENDING_PATH = os.environ.get("AGROGO_PENDING", "/home/agrogodev/my_device_app/pending_readings.jsonl")
+
+LOCAL_TZ = ZoneInfo("America/Detroit")
 
-LOCAL_TZ = pytz.timezone("America/Detroit")
+# Parsed config.json keyed by its mtime, so repeat loads skip the disk read
+_CONFIG_CACHE = {"mtime_ns": None, "cfg": None}
+# Digest of the last blob written, so unchanged saves don't wear the SD card
+_LAST_SAVED_DIGEST = {"value": None}
+# main.py saves from worker threads; reentrant because a load may save defaults
+_CONFIG_LOCK = threading.RLock()
 
+
+def _with_config_lock(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with _CONFIG_LOCK:
+            return fn(*args, **kwargs)
+    return wrapper
+
+@functools.lru_cache(maxsize=1)
 def get_mac() -> str:
     """
     Return MAC address in canonical colon-separated format.
     Uses uuid.getnode() fallback; on Linux this should be stable.
+    Computed once per process; later calls return the cached string.
     """
-    mac_int = uuid.getnode()
-    mac_str = ":".join([f"{(mac_int >> ele) & 0xff:02x}" for ele in range(0, 8 * 6, 8)][::-1])
-    return mac_str.lower()
+    return uuid.getnode().to_bytes(6, "big").hex(":")
 
 def is_paired(config: dict) -> bool:
     """
@@ -40,10 +90,14 @@ def is_paired(config: dict) -> bool:
     except Exception:
         return False
 
+@_with_config_lock
 def load_local_config() -> Dict[str, Any]:
     """
     Load config.json if it exists, otherwise create a default skeleton.
     Returns a dict that always contains at least deviceId, paired(boolean).
+    The parsed dict is cached until config.json's mtime changes; each call
+    gets its own top-level copy, so a caller's unsaved changes never show
+    up in another caller's load.
     """
     default = {
         "deviceId": None,
@@ -66,8 +120,11 @@ def load_local_config() -> Dict[str, Any]:
         return default
 
     try:
-        with open(CONFIG_PATH, "r") as fh:
-            cfg = json.load(fh)
+        mtime_ns = os.stat(CONFIG_PATH).st_mtime_ns
+        if _CONFIG_CACHE["mtime_ns"] == mtime_ns:
+            return dict(_CONFIG_CACHE["cfg"])
+        with open(CONFIG_PATH, "rb") as fh:
+            cfg = _loads(fh.read())
     except Exception:
         # If file corrupted, overwrite a default
         save_local_config(default)
@@ -77,65 +134,263 @@ def load_local_config() -> Dict[str, Any]:
     for k, v in default.items():
         if k not in cfg:
             cfg[k] = v
-    return cfg
+    _CONFIG_CACHE["mtime_ns"] = mtime_ns
+    _CONFIG_CACHE["cfg"] = cfg
+    return dict(cfg)
 
 
-def save_local_config(data: Dict[str, Any]) -> None:
+@_with_config_lock
+def save_local_config(data: Dict[str, Any], durable: bool = True) -> None:
     """
     Atomically write config.json to prevent corruption on power loss.
+    Skips the write entirely when the content matches the last save.
+    durable=False skips the fsync for updates that are cheap to recompute
+    if lost; the rename is still atomic, the data just may not survive a
+    power cut.
     """
-    # Use atomic write via tempfile then replace
-    dirpath = os.path.dirname(CONFIG_PATH)
-    fd, tmpfile = tempfile.mkstemp(dir=dirpath)
+    blob = _dumps_config(data)
+    digest = hashlib.sha1(blob).digest()
+    if digest == _LAST_SAVED_DIGEST["value"] and os.path.exists(CONFIG_PATH):
+        return
+    # First save in this process: compare against what is already on disk
+    try:
+        with open(CONFIG_PATH, "rb") as fh:
+            if fh.read() == blob:
+                _LAST_SAVED_DIGEST["value"] = digest
+                return
+    except OSError:
+        pass
+
+    # Use atomic write via a sibling temp file then replace; the fixed name
+    # means a crash leaves at most one stale file, overwritten next save
+    tmpfile = CONFIG_PATH + ".tmp"
     try:
-        with os.fdopen(fd, "w") as fh:
-            json.dump(data, fh, indent=2, sort_keys=True)
-            fh.flush()
-            os.fsync(fh.fileno())
+        with open(tmpfile, "wb", buffering=64 * 1024) as fh:
+            fh.write(blob)
+            if durable:
+                fh.flush()
+                os.fsync(fh.fileno())
         os.replace(tmpfile, CONFIG_PATH)
+        # What we just wrote is what the next load would parse
+        _CONFIG_CACHE["mtime_ns"] = os.stat(CONFIG_PATH).st_mtime_ns
+        _CONFIG_CACHE["cfg"] = dict(data)
+        _LAST_SAVED_DIGEST["value"] = digest
     finally:
-        if os.path.exists(tmpfile):
-            try:
-                os.remove(tmpfile)
-            except Exception:
-                pass
+        # Normally already renamed away, so a miss is the expected case
+        try:
+            os.remove(tmpfile)
+        except OSError:
+            pass
 
 
-def log_info(msg: str) -> None:
+# device.log lines are written in batches: every LOG_FLUSH_LINES lines or
+# LOG_FLUSH_SECONDS, whichever comes first, instead of one write per line
+LOG_FLUSH_LINES = 64
+LOG_FLUSH_SECONDS = 5
+
+
+class _BatchedFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that leaves records in the file buffer until a batch is due."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._unflushed = 0
+
+    def _open(self):
+        stream = super()._open()
+        self._size = os.fstat(stream.fileno()).st_size
+        return stream
+
+    def shouldRollover(self, record):
+        # The base class seeks/tells on the stream, which writes the buffer out
+        # on every record; track the file size ourselves instead
+        if self.stream is None:
+            self.stream = self._open()
+        self._size += len(self.format(record)) + 1
+        return self._size >= self.maxBytes
+
+    def flush(self):
+        # StreamHandler.emit calls this after every record; only write through
+        # once a full batch is buffered (the flusher thread covers the rest)
+        self._unflushed += 1
+        if self._unflushed >= LOG_FLUSH_LINES:
+            self.flush_now()
+
+    def flush_now(self):
+        self.acquire()
+        try:
+            self._unflushed = 0
+            super().flush()
+        finally:
+            self.release()
+
+
+class _LocalTimeFormatter(logging.Formatter):
     """
-    Simple logger that prints to stdout and appends to LOG_PATH.
-    Systemd can capture stdout; we still append to a file for convenience.
+    Stamps records in LOCAL_TZ and formats each wall-clock second only
+    once, reusing the string for bursts of lines within that second.
     """
-    now_local = datetime.now(timezone.utc).astimezone(LOCAL_TZ)
-    
-    timestamp = now_local.strftime("%Y-%m-%d %H:%M:%S")
-    line = f"{timestamp} - {msg}"
-    print(line, flush=True)
+
+    def __init__(self, fmt=None, datefmt=None):
+        super().__init__(fmt, datefmt)
+        # (second, stamp) swapped as one object: handlers on other threads
+        # share this formatter and must never pair a second with another's stamp
+        self._last = (None, "")
+
+    def formatTime(self, record, datefmt=None):
+        second = int(record.created)
+        last_second, stamp = self._last
+        if second != last_second:
+            stamp = datetime.fromtimestamp(second, LOCAL_TZ).strftime(datefmt or self.datefmt)
+            self._last = (second, stamp)
+        return stamp
+
+
+def _flush_periodically(handler: _BatchedFileHandler) -> None:
+    while True:
+        time.sleep(LOG_FLUSH_SECONDS)
+        handler.flush_now()
+
+
+def _build_logger() -> logging.Logger:
+    """
+    Configure the shared "agrogo" logger once per process: stdout for
+    systemd plus a size-capped device.log that stays open between lines.
+    """
+    logger = logging.getLogger("agrogo")
+    if logger.handlers:
+        return logger
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    formatter = _LocalTimeFormatter("%(asctime)s - %(message)s", "%Y-%m-%d %H:%M:%S")
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(formatter)
+    logger.addHandler(stream)
     try:
-        with open(LOG_PATH, "a") as fh:
-            fh.write(line + "\n")
-    except Exception:
-        # if logging fails (permissions, missing dir) ignore silently
+        os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+        file_handler = _BatchedFileHandler(LOG_PATH, maxBytes=1_000_000, backupCount=3)
+        file_handler.setFormatter(formatter)
+        logger.addHandler(file_handler)
+        threading.Thread(target=_flush_periodically, args=(file_handler,), daemon=True).start()
+    except OSError:
+        # if the log file can't be opened (permissions, read-only fs) keep stdout only
         pass
+    return logger
+
+
+_LOGGER = _build_logger()
+
+
+def _exit_on_sigterm(signum, frame):
+    # systemctl stop/restart sends SIGTERM, whose default action skips
+    # atexit and would drop the batched log lines; exit normally instead
+    raise SystemExit(128 + signum)
+
+
+if (
+    threading.current_thread() is threading.main_thread()
+    and signal.getsignal(signal.SIGTERM) is signal.SIG_DFL
+):
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+
+
+def log_info(msg: str) -> None:
+    """
+    Log msg to stdout and LOG_PATH.
+    Systemd can capture stdout; we still append to a file for convenience.
+    """
+    _LOGGER.info(msg)
+
+
+def flush_logs() -> None:
+    """
+    Write any batched log lines to disk now. Normal exits do this via
+    logging's atexit hook; call it before os.execv, which skips atexit.
+    """
+    for handler in _LOGGER.handlers:
+        if isinstance(handler, _BatchedFileHandler):
+            handler.flush_now()
 
 
 # Short helper wrappers for HTTP to keep main code readable
-import requests
 
+# One keep-alive session for every backend call so the TLS connection is
+# reused across loops instead of re-handshaking each request.
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=4,
+        max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504]),
+    ),
+)
+# Pinned explicitly so a per-call headers dict can't drop them by accident
+SESSION.headers.update({"Accept-Encoding": "gzip", "Connection": "keep-alive"})
+
+
+# (url, params) -> (etag, last_modified, parsed body) from the last 200
+_GET_CACHE = {}
 
-def http_get_json(url: str, headers: dict = None, params: dict = None, timeout: int = 10):
+
+def http_get_json(url: str, headers: dict = None, params: dict = None, timeout=(3, 10)):
     """
     GET request that returns parsed JSON or raises.
+    Sends the validators from the previous response so an unchanged
+    resource comes back as an empty 304 and the cached body is reused.
     """
-    r = requests.get(url, headers=headers or {}, params=params or {}, timeout=timeout)
+    key = (url, tuple(sorted((params or {}).items())))
+    headers = dict(headers or {})
+    cached = _GET_CACHE.get(key)
+    if cached:
+        etag, last_modified, _ = cached
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    r = SESSION.get(url, headers=headers, params=params or {}, timeout=timeout)
+    if r.status_code == 304 and cached:
+        return cached[2]
+    r.raise_for_status()
+    body = r.json()
+    etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+    if etag or last_modified:
+        _GET_CACHE[key] = (etag, last_modified, body)
+    else:
+        _GET_CACHE.pop(key, None)
+    return body
+
+
+def _post_body(url: str, data: bytes, content_type: str, headers: dict, timeout, compress: bool):
+    headers = {**(headers or {}), "Content-Type": content_type}
+    if compress:
+        import gzip  # only needed when the backend opted in to compressed uploads
+        data = gzip.compress(data, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    r = SESSION.post(url, data=data, headers=headers, timeout=timeout)
     r.raise_for_status()
-    return r.json()
+    return r
 
 
-def http_post_json(url: str, body: dict, headers: dict = None, timeout: int = 10):
+def http_post_json(url: str, body: dict, headers: dict = None, timeout=(3, 10), compress: bool = False):
     """
     POST JSON; returns response object.
+    With compress=True the body is sent gzip'd (Content-Encoding: gzip).
     """
-    r = requests.post(url, json=body, headers=headers or {}, timeout=timeout)
-    r.raise_for_status()
-    return r
+    data = _dumps_compact(body)
+    return _post_body(url, data, "application/json", headers, timeout, compress)
+
+
+def http_post_msgpack(url: str, body: dict, headers: dict = None, timeout=(3, 10), compress: bool = False):
+    """
+    POST body as MessagePack; returns response object.
+    Falls back to http_post_json when msgpack isn't installed.
+    """
+    try:
+        import msgpack  # optional, only needed when the backend opted in
+    except ImportError:
+        return http_post_json(url, body, headers=headers, timeout=timeout, compress=compress)
+    data = msgpack.packb(body, use_bin_type=True)
+    return _post_body(url, data, "application/x-msgpack", headers, timeout, compress)